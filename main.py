@@ -3,15 +3,40 @@
 # ==========================
 from fastapi import FastAPI, HTTPException              # Framework para crear la API y manejar errores HTTP
 from fastapi.middleware.cors import CORSMiddleware      # Middleware para permitir CORS (consumir API desde otras apps)
-from pydantic import BaseModel, Field, PositiveFloat, conint, constr  # Validaciones y tipos para los modelos
-from typing import Optional, List                       # Anotaciones de tipos opcionales y listas
+from fastapi.responses import Response, StreamingResponse  # Respuestas ya serializadas / enviadas por trozos
+from pydantic import BaseModel, Field, PositiveFloat, StringConstraints, TypeAdapter, ValidationError, WithJsonSchema, conint, constr  # Validaciones y tipos para los modelos
+from typing import Annotated, Optional, List, Dict, Iterator, Set, Tuple, Union  # Anotaciones de tipos opcionales, listas e iteradores
 from datetime import datetime                           # Manejo de fechas (creado_en)
-import os, json, asyncio                                # Archivos, JSON y concurrencia asíncrona
+from contextlib import asynccontextmanager              # Ciclo de vida de la app (arranque/apagado)
+from itertools import count, islice                     # Contador de IDs y recorrer una porción de lista sin copiarla
+import os, asyncio, atexit, mmap                        # Archivos, concurrencia, cierre ordenado y mmap
+import logging                                          # Aviso si el escritor en segundo plano muere
+import struct                                           # Registros binarios de ancho fijo (productos.idx)
+import orjson                                           # JSON rápido (C/SIMD); serializa datetime de forma nativa
 
 # ==========================
 # Instancia principal de la aplicación
 # ==========================
-app = FastAPI(title="API Registro de Productos", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Arranca el escritor en segundo plano (ver _writer_task, más abajo) y, al apagar,
+    espera a que la cola de escritura quede vacía para no perder productos.
+    La cola y el semáforo se crean aquí, en cada arranque: quedan ligados al event
+    loop que los usa, así que no se pueden reutilizar si la app se levanta de nuevo
+    en el mismo proceso (p. ej. varios `with TestClient(app)` seguidos).
+    """
+    global _writer, write_queue, _cupos
+    write_queue = asyncio.Queue(maxsize=WRITE_QUEUE_MAX)
+    _cupos = asyncio.Semaphore(WRITE_QUEUE_MAX)
+    _writer = asyncio.create_task(_writer_task())
+    _writer.add_done_callback(_writer_terminado)
+    yield
+    if not _writer.done():
+        await write_queue.join()  # Si el escritor murió, nadie vaciaría la cola
+    _writer.cancel()
+
+app = FastAPI(title="API Registro de Productos", version="1.0.0", lifespan=lifespan)
 
 # ==========================
 # Configuración de CORS
@@ -40,12 +65,32 @@ class ProductoIn(BaseModel):
     stock: conint(ge=0) = Field(0, description="Stock >= 0")      # Entero >= 0, por defecto 0
     descripcion: Optional[constr(max_length=200)] = None
 
+# Fecha/hora ISO 8601 como string (la forma en que creado_en queda guardado en el JSONL).
+# Se valida el formato con un patrón, sin construir un datetime.
+FechaISO = Annotated[str, StringConstraints(
+    pattern=r"^\d{4}-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])[T ]([01]\d|2[0-3]):[0-5]\d:[0-5]\d"
+            r"(\.\d{1,6})?(Z|[+-]([01]\d|2[0-3]):[0-5]\d)?$"
+)]
+
 class ProductoOut(ProductoIn):
     """
     Datos de SALIDA al cliente (incluye ID y fecha de creación).
     """
     id: int
-    creado_en: datetime  # Se almacenará como datetime; se serializa a ISO en JSON
+    # Los productos nuevos llevan datetime; los leídos de disco conservan el string ISO
+    # tal cual (FechaISO se prueba primero): no se parsea a datetime solo para volver a
+    # formatearlo al responder. Un string que no sea ISO 8601 se sigue rechazando.
+    # En JSON (y en el esquema OpenAPI) ambos son un string date-time.
+    creado_en: Annotated[
+        Union[FechaISO, datetime],
+        Field(union_mode="left_to_right"),
+        WithJsonSchema({"type": "string", "format": "date-time"}),
+    ]
+
+# Validadores precompilados: parsean y validan JSON directamente en pydantic-core,
+# sin pasar por un dict intermedio ni por ProductoOut.__init__.
+PRODUCTO_ADAPTER = TypeAdapter(ProductoOut)               # Un producto
+PRODUCTOS_ADAPTER = TypeAdapter(List[ProductoOut])        # Lote completo en una sola llamada
 
 # ==========================
 # Configuración de archivos / almacenamiento
@@ -53,6 +98,9 @@ class ProductoOut(ProductoIn):
 DATA_DIR = "data"                                             # Carpeta donde se guardan los archivos
 TEXT_FILE = os.path.join(DATA_DIR, "productos.txt")           # Archivo de texto legible (pipe-separated)
 JSONL_FILE = os.path.join(DATA_DIR, "productos.jsonl")        # Archivo JSONL (un JSON por línea)
+LAST_ID_FILE = os.path.join(DATA_DIR, "last_id")              # Último ID persistido (contador, escritura atómica)
+IDX_FILE = os.path.join(DATA_DIR, "productos.idx")            # Índice binario: (id, offset, longitud) por línea del JSONL
+IDX_RECORD = struct.Struct("<QQQ")                            # 24 bytes por registro del índice
 os.makedirs(DATA_DIR, exist_ok=True)                          # Crear carpeta data/ si no existe
 
 # Si el archivo de texto no existe, escribir cabecera
@@ -60,176 +108,495 @@ if not os.path.exists(TEXT_FILE):
     with open(TEXT_FILE, "w", encoding="utf-8") as f:
         f.write("id|nombre|categoria|precio|stock|creado_en|descripcion\n")
 
-def _cargar_ultimo_id() -> int:
+# Manejadores de escritura persistentes: se abren una sola vez (modo binario, append)
+# en lugar de abrir/cerrar los archivos en cada alta, y se cierran al terminar el proceso.
+# Van SIN buffer: cada lote se arma en memoria y se escribe de una vez, y si la
+# escritura falla no quedan bytes pendientes en un buffer que se reescribirían
+# con el lote siguiente.
+# Si una caída dejó un registro del índice a medias, se descarta: si no, todos los
+# registros agregados después quedarían corridos y la búsqueda binaria leería basura.
+if os.path.exists(IDX_FILE) and os.path.getsize(IDX_FILE) % IDX_RECORD.size:
+    os.truncate(IDX_FILE, os.path.getsize(IDX_FILE) // IDX_RECORD.size * IDX_RECORD.size)
+TEXT_FH = open(TEXT_FILE, "ab", buffering=0)
+JSONL_FH = open(JSONL_FILE, "ab", buffering=0)
+IDX_FH = open(IDX_FILE, "ab", buffering=0)
+atexit.register(lambda: (TEXT_FH.close(), JSONL_FH.close(), IDX_FH.close()))
+# Bytes de productos.jsonl / productos.idx escritos por lotes que terminaron bien.
+# Un lote que falla solo se trunca hasta su propio inicio, que nunca queda por
+# debajo de estos valores: lo que los lectores mapean o leen dentro de ellos no
+# desaparece bajo sus pies (leer un mmap más allá del fin del archivo es SIGBUS).
+_jsonl_confirmado = os.fstat(JSONL_FH.fileno()).st_size
+_idx_confirmado = os.fstat(IDX_FH.fileno()).st_size
+
+def _cargar_productos() -> None:
     """
-    Lee productos.jsonl (si existe) para recuperar el último ID utilizado.
-    Permite que la API continúe incrementando IDs aun tras reinicios.
+    Lee productos.jsonl (si existe) y llena el índice en memoria
+    (PRODUCTS / PRODUCTS_ORDER) en una sola pasada, así las lecturas posteriores
+    no vuelven a abrir ni parsear el archivo.
     """
     if not os.path.exists(JSONL_FILE):
-        return 0
-    last_id = 0
-    with open(JSONL_FILE, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
+        return
+    # Una sola lectura grande del archivo completo
+    with open(JSONL_FILE, "rb", buffering=1 << 20) as f:
+        contenido = f.read().strip()
+    try:
+        # Camino rápido: cada salto de línea pasa a ser una coma (un replace en C, sin
+        # crear un objeto por línea) y todo el archivo se valida como un único arreglo
+        productos = PRODUCTOS_ADAPTER.validate_json(b"[" + contenido.replace(b"\n", b",") + b"]")
+    except ValidationError:
+        # Hay líneas corruptas o vacías: se validan una por una y se ignoran las malas
+        productos = []
+        for line in contenido.split(b"\n"):
             try:
-                obj = json.loads(line)
-                last_id = max(last_id, int(obj.get("id", 0)))
-            except json.JSONDecodeError:
-                # Si hay líneas corruptas, se ignoran para no romper el flujo
+                productos.append(PRODUCTO_ADAPTER.validate_json(line))
+            except ValidationError:
                 continue
-    return last_id
+    for p in productos:
+        if p.id not in PRODUCTS:
+            PRODUCTS_ORDER.append(p.id)
+        PRODUCTS[p.id] = p
+
+def _cargar_ultimo_id() -> int:
+    """
+    Recupera el último ID utilizado desde data/last_id.
+    Permite que la API continúe incrementando IDs aun tras reinicios.
+    El sidecar se actualiza DESPUÉS de escribir los datos, así que tras una caída
+    puede quedar atrás del JSONL: por eso se toma el máximo con el mayor ID ya
+    cargado en el índice (no cuesta nada, _cargar_productos ya leyó todo).
+    Si el archivo falta o está dañado, se usa solo el mayor ID del índice.
+    """
+    max_indice = max(PRODUCTS, default=0)
+    try:
+        with open(LAST_ID_FILE, "r", encoding="utf-8") as f:
+            return max(int(f.read()), max_indice)
+    except (OSError, ValueError):
+        return max_indice
+
+def _guardar_ultimo_id(valor: int) -> None:
+    """
+    Persiste el último ID de forma atómica: se escribe un temporal y se renombra
+    con os.replace, de modo que last_id nunca queda a medio escribir.
+    """
+    tmp = LAST_ID_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(str(valor))
+    os.replace(tmp, LAST_ID_FILE)
 
 # Estado en memoria
-ultimo_id = _cargar_ultimo_id()      # Último ID usado (persistido por jsonl)
-lock = asyncio.Lock()                # Lock para evitar condiciones de carrera en concurrencia
+PRODUCTS: Dict[int, ProductoOut] = {}    # Índice id -> producto (lecturas O(1) sin tocar disco)
+PRODUCTS_ORDER: List[int] = []           # IDs en orden de inserción (para listar como en el archivo)
+_HUECOS: Set[int] = set()                # IDs repartidos cuyo lote falló: no existen en disco
+_cargar_productos()
+ultimo_id = _cargar_ultimo_id()          # Último ID repartido (cota para descartar IDs inexistentes)
+# Próximos IDs: next() sobre itertools.count es atómico (una sola llamada en C),
+# así que no hace falta un lock para repartir IDs sin repetir.
+_id_counter = count(ultimo_id + 1)       # Continúa tras el último ID persistido en data/last_id
+WRITE_QUEUE_MAX = 1024                   # Altas pendientes de escribir como máximo (contrapresión)
+# Cola (fields, JSON en bytes, futuro o None) de lo pendiente de escribir a disco.
+# La cola, el semáforo y el escritor los crea lifespan en cada arranque.
+write_queue: Optional[asyncio.Queue] = None
+_cupos: Optional[asyncio.Semaphore] = None  # Lugares libres en write_queue; se reservan ANTES de tomar el ID
+_writer: Optional[asyncio.Task] = None   # Tarea del escritor
+logger = logging.getLogger(__name__)
+STREAM_CHUNK = 256                       # Productos serializados por trozo en GET /productos
+EXPORT_CHUNK = 64 * 1024                 # Bytes por lectura (os.pread) en GET /productos/raw
+ESCANEO_JSONL = False                    # Recorrer productos.jsonl si el ID no está ni en memoria ni en el idx (ver _buscar_en_jsonl)
 
 # ==========================
 # Utilidades internas
 # ==========================
-def _to_text_line(p: ProductoOut) -> str:
+# Tabla de escape para productos.txt: saltos de línea -> espacio, pipes -> '/'
+_TRANS = str.maketrans({"\n": " ", "|": "/"})
+
+def _to_text_line(d: dict) -> str:
     """
-    Convierte un producto a una línea para productos.txt con separador '|'.
-    Se escapan saltos de línea y pipes para no romper el formato.
+    Convierte los campos de un producto (el mismo dict que se serializa al JSONL)
+    a una línea para productos.txt con separador '|'.
+    Se escapan saltos de línea y pipes para no romper el formato
+    (un solo str.translate por campo en lugar de dos replace encadenados).
     """
-    def esc(s: Optional[str]) -> str:
-        if s is None:
-            return ""
-        return str(s).replace("\n", " ").replace("|", "/")
     # creado_en se serializa en ISO 8601
-    return f"{p.id}|{esc(p.nombre)}|{esc(p.categoria)}|{p.precio}|{p.stock}|{p.creado_en.isoformat()}|{esc(p.descripcion)}\n"
+    return "|".join((
+        str(d["id"]),
+        (d["nombre"] or "").translate(_TRANS),
+        (d["categoria"] or "").translate(_TRANS),
+        str(d["precio"]),
+        str(d["stock"]),
+        d["creado_en"].isoformat(),
+        (d["descripcion"] or "").translate(_TRANS),
+    )) + "\n"
+
+def _escribir_todo(fh, datos: bytes) -> None:
+    """
+    Escribe `datos` completos en un manejador sin buffer
+    (write() sobre el archivo crudo puede escribir menos bytes de los pedidos).
+    """
+    vista = memoryview(datos)
+    while vista:
+        vista = vista[fh.write(vista):]
 
-def _guardar_producto(p: ProductoOut) -> None:
+def _escribir_lote(productos: List[Tuple[dict, bytes]]) -> None:
     """
-    Persiste el producto en:
+    Persiste un lote de productos en:
     - productos.txt (humano-legible, separado por '|')
     - productos.jsonl (máquina-legible, un JSON por línea)
-    Maneja diferencias entre Pydantic v1 y v2.
+    - productos.idx (id, offset y longitud de cada línea del JSONL)
+    Cada tupla trae los `fields` del producto (de ahí sale la línea de texto, sin
+    pasar por Pydantic) y su JSON ya serializado una sola vez por crear_producto
+    (el mismo que se envió como respuesta).
+    El índice se escribe después del JSONL, así nunca apunta a bytes que aún no
+    se escribieron. Si una escritura falla (p. ej. disco lleno), los tres archivos
+    se truncan a su tamaño previo al lote y se propaga el error; ese tamaño nunca
+    es menor que _jsonl_confirmado / _idx_confirmado, lo único que ven los lectores.
+    Al final actualiza data/last_id.
+    Se ejecuta en un hilo del executor para no bloquear el event loop.
     """
-    # 1) Guardar en TXT
-    with open(TEXT_FILE, "a", encoding="utf-8") as f:
-        f.write(_to_text_line(p))
-
-    # 2) Preparar dict serializable para JSON
+    # Posiciones antes de escribir: base de los offsets del índice y punto de vuelta atrás
+    inicio = [(fh, fh.tell()) for fh in (TEXT_FH, JSONL_FH, IDX_FH)]
+    offset = inicio[1][1]
+    texto, jsonl, registros = [], [], []
+    for fields, payload in productos:
+        texto.append(_to_text_line(fields).encode("utf-8"))
+        jsonl.append(payload + b"\n")
+        registros.append(IDX_RECORD.pack(fields["id"], offset, len(payload)))
+        offset += len(payload) + 1
     try:
-        # Pydantic v2: convierte datetime a string ISO automáticamente
-        data = p.model_dump(mode="json")
+        _escribir_todo(TEXT_FH, b"".join(texto))
+        _escribir_todo(JSONL_FH, b"".join(jsonl))
+        _escribir_todo(IDX_FH, b"".join(registros))
     except Exception:
-        # Pydantic v1
+        for fh, pos in inicio:
+            try:
+                os.ftruncate(fh.fileno(), pos)
+                fh.seek(pos)
+            except OSError:
+                pass  # Si ni siquiera se puede truncar, la línea a medias se ignora al leer
+        raise
+    try:
+        _guardar_ultimo_id(productos[-1][0]["id"])  # El lote llega en orden de ID
+    except OSError:
+        pass  # Los datos ya están en disco; al arrancar se toma el máximo con el JSONL
+
+async def _writer_task() -> None:
+    """
+    Tarea de fondo: único consumidor de write_queue y único que escribe a disco.
+    Toma todo lo pendiente como un lote y lo escribe en el executor (la espera de
+    disco cede el event loop a las demás peticiones); luego resuelve los futuros
+    de quienes pidieron ?sync=1 (o les propaga el error).
+    Solo tras un lote completo avanza _jsonl_confirmado / _idx_confirmado.
+    """
+    global _jsonl_confirmado, _idx_confirmado
+    loop = asyncio.get_running_loop()
+    while True:
+        lote = [await write_queue.get()]
+        while not write_queue.empty():
+            lote.append(write_queue.get_nowait())
         try:
-            data = p.dict()
-        except Exception:
-            # Último recurso (no debería ocurrir)
-            data = p.__dict__
+            await loop.run_in_executor(None, _escribir_lote, [(fields, payload) for fields, payload, _ in lote])
+        except Exception as e:
+            for fields, _, hecho in lote:
+                # El lote no quedó en disco: se retira del índice para no servir
+                # productos que no existen
+                PRODUCTS.pop(fields["id"], None)
+                _HUECOS.add(fields["id"])
+                if hecho is not None and not hecho.done():
+                    hecho.set_exception(e)
+        else:
+            _jsonl_confirmado, _idx_confirmado = JSONL_FH.tell(), IDX_FH.tell()
+            for _, _, hecho in lote:
+                if hecho is not None and not hecho.done():
+                    hecho.set_result(None)
+        finally:
+            for _ in lote:
+                write_queue.task_done()
+                _cupos.release()
 
-    # 3) Guardar en JSONL (asegurando serialización de cualquier tipo no JSON con default=str)
-    with open(JSONL_FILE, "a", encoding="utf-8") as f:
-        f.write(json.dumps(data, ensure_ascii=False, default=str) + "\n")
+def _writer_terminado(tarea: asyncio.Task) -> None:
+    """
+    Callback de fin del escritor: si termina por un error (y no por el cancel del
+    apagado) lo registra en el log en el momento, en lugar de que solo se note
+    después como un 503 en cada alta.
+    """
+    if not tarea.cancelled() and tarea.exception() is not None:
+        logger.error("El escritor de productos se detuvo; las altas responderán 503",
+                     exc_info=tarea.exception())
 
-def _leer_todos() -> List[ProductoOut]:
+def _leer_todos() -> Iterator[ProductoOut]:
     """
-    Lee todos los productos desde productos.jsonl y los convierte a objetos ProductoOut.
-    Si hay líneas corruptas, se ignoran (no detienen el proceso).
+    Recorre los productos del índice en memoria, en orden de inserción.
+    Se fija la longitud al empezar: lo que se cree durante el recorrido no se incluye.
+    Se saltan los IDs retirados del índice porque su escritura falló.
     """
-    res: List[ProductoOut] = []
-    if not os.path.exists(JSONL_FILE):
-        return res
+    for i in islice(PRODUCTS_ORDER, len(PRODUCTS_ORDER)):
+        p = PRODUCTS.get(i)
+        if p is not None:
+            yield p
 
-    with open(JSONL_FILE, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                d = json.loads(line)
-                # Compatibilidad: si creado_en viene como string ISO, parsearlo a datetime
-                if isinstance(d.get("creado_en"), str):
-                    d["creado_en"] = datetime.fromisoformat(d["creado_en"])
-                res.append(ProductoOut(**d))
-            except Exception:
-                # Ignorar y continuar si una línea específica está mal
-                continue
-    return res
+def _listar_json() -> Iterator[bytes]:
+    """
+    Genera el arreglo JSON de productos por trozos de STREAM_CHUNK elementos.
+    Nunca se arma la lista completa ni su JSON en memoria: el pico de memoria de la
+    respuesta queda acotado sin importar cuántos productos haya.
+    """
+    yield b"["
+    separador = b""
+    trozo: List[bytes] = []
+    for p in _leer_todos():
+        trozo.append(orjson.dumps(p.model_dump()))
+        if len(trozo) >= STREAM_CHUNK:
+            yield separador + b",".join(trozo)
+            separador, trozo = b",", []
+    if trozo:
+        yield separador + b",".join(trozo)
+    yield b"]"
 
-def _leer_por_id(producto_id: int) -> Optional[ProductoOut]:
+def _fin_ultima_linea(hasta: int) -> int:
     """
-    Busca un producto específico por ID dentro de productos.jsonl.
-    Devuelve ProductoOut o None si no existe.
+    Devuelve cuántos de los primeros `hasta` bytes de productos.jsonl forman líneas
+    completas: la posición justo después del último salto de línea. Lo que viene
+    después (p. ej. una línea cortada por una caída, al arrancar) se deja fuera.
     """
-    if not os.path.exists(JSONL_FILE):
-        return None
+    with open(JSONL_FILE, "rb") as f:
+        fin = hasta
+        while fin > 0:
+            inicio = max(0, fin - EXPORT_CHUNK)
+            pos = os.pread(f.fileno(), fin - inicio, inicio).rfind(b"\n")
+            if pos != -1:
+                return inicio + pos + 1
+            fin = inicio
+    return 0
 
-    with open(JSONL_FILE, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                d = json.loads(line)
-                if int(d.get("id", -1)) == producto_id:
-                    if isinstance(d.get("creado_en"), str):
-                        d["creado_en"] = datetime.fromisoformat(d["creado_en"])
-                    return ProductoOut(**d)
-            except Exception:
-                continue
+def _exportar_jsonl(limite: int) -> Iterator[bytes]:
+    """
+    Envía exactamente los primeros `limite` bytes de productos.jsonl, con os.pread
+    por trozos de EXPORT_CHUNK. Lo que el escritor agregue mientras tanto no se
+    envía, así el cuerpo siempre coincide con el Content-Length anunciado.
+    `limite` sale de _jsonl_confirmado, que un lote fallido nunca trunca. Si aun así
+    el archivo queda más corto (truncado desde fuera de la API), se lanza un error:
+    el servidor corta la conexión y el cliente ve una descarga incompleta, en lugar
+    de un cuerpo más corto que su Content-Length que termina "bien".
+    """
+    with open(JSONL_FILE, "rb") as f:
+        offset = 0
+        while offset < limite:
+            trozo = os.pread(f.fileno(), min(EXPORT_CHUNK, limite - offset), offset)
+            if not trozo:
+                raise OSError(f"{JSONL_FILE} se truncó durante la exportación "
+                              f"({offset} de {limite} bytes enviados)")
+            offset += len(trozo)
+            yield trozo
+
+def _buscar_en_jsonl(producto_id: int) -> Optional[ProductoOut]:
+    """
+    Búsqueda de respaldo directamente sobre productos.jsonl, para IDs que no están
+    en el índice en memoria ni en productos.idx. Con un único proceso escritor no
+    recupera nada: todo lo válido del JSONL ya se cargó al arrancar, y una línea
+    que se saltó al cargar tampoco valida aquí. Como cada 404 por un hueco costaría
+    un recorrido completo del archivo, solo se usa si ESCANEO_JSONL está activado
+    (p. ej. para diagnosticar un JSONL sospechoso), y nunca para IDs de _HUECOS.
+    El archivo se mapea con mmap en cada búsqueda (mapear es O(1)), solo hasta
+    _jsonl_confirmado: un lote que falle no puede truncar esa parte mientras está
+    mapeada. En lugar de parsear cada línea se busca "id":<n> en los bytes del
+    mapeo (mmap.find, en C): solo se parsean las líneas que lo contienen.
+    """
+    # orjson escribe "id":5; el json estándar (datos antiguos) escribía "id": 5.
+    # "id":5 también aparece en "id":50, por eso cada candidato se verifica al parsear.
+    needles = (b'"id":%d' % producto_id, b'"id": %d' % producto_id)
+    tamano = _jsonl_confirmado
+    if tamano == 0:
+        return None  # mmap no admite archivos vacíos
+    with open(JSONL_FILE, "rb") as f:
+        with mmap.mmap(f.fileno(), tamano, access=mmap.ACCESS_READ) as mm:
+            for needle in needles:
+                pos = mm.find(needle)
+                while pos != -1:
+                    inicio = mm.rfind(b"\n", 0, pos) + 1
+                    fin = mm.find(b"\n", pos)
+                    if fin == -1:
+                        fin = len(mm)
+                    pos = mm.find(needle, fin)
+                    try:
+                        d = orjson.loads(mm[inicio:fin])
+                        if d.get("id") == producto_id:
+                            return PRODUCTO_ADAPTER.validate_python(d)
+                    except Exception:
+                        # Líneas corruptas o a medio escribir: se ignoran
+                        continue
     return None
 
+def _buscar_en_idx(producto_id: int) -> Optional[ProductoOut]:
+    """
+    Búsqueda de respaldo usando productos.idx, para IDs que no están en el índice
+    en memoria: búsqueda binaria sobre los registros de 24 bytes y luego una sola
+    lectura (os.pread) de exactamente los bytes del producto en el JSONL.
+    El caso que recupera: una caída deja la última línea del JSONL cortada, sin
+    salto de línea, y el primer producto escrito tras reiniciar queda pegado a ella
+    ({"id":5,"nom{"id":5,...}). Al cargar, esa línea no valida y el producto no
+    entra en memoria (ni en el listado), pero su registro apunta a donde empieza su
+    JSON, así que GET /productos/{id} lo sigue encontrando. Una línea que no valida
+    por su contenido (p. ej. precio negativo) tampoco valida aquí.
+    La búsqueda binaria depende de que haya un único proceso escritor, que agrega
+    los registros en orden de ID; no es un mecanismo para varios workers.
+    Se mapean solo los registros de lotes confirmados (_idx_confirmado), que un lote
+    fallido nunca trunca; los del lote en curso siguen en el índice en memoria.
+    """
+    n = _idx_confirmado // IDX_RECORD.size
+    if n == 0:
+        return None  # mmap no admite archivos vacíos
+    with open(IDX_FILE, "rb") as fi:
+        with mmap.mmap(fi.fileno(), n * IDX_RECORD.size, access=mmap.ACCESS_READ) as mm:
+            lo, hi = 0, n
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if IDX_RECORD.unpack_from(mm, mid * IDX_RECORD.size)[0] < producto_id:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo == n:
+                return None
+            pid, offset, length = IDX_RECORD.unpack_from(mm, lo * IDX_RECORD.size)
+    if pid != producto_id:
+        return None
+    with open(JSONL_FILE, "rb") as fj:
+        try:
+            return PRODUCTO_ADAPTER.validate_json(os.pread(fj.fileno(), length, offset))
+        except ValidationError:
+            return None
+
+def _leer_por_id(producto_id: int) -> Optional[ProductoOut]:
+    """
+    Busca un producto específico por ID en el índice en memoria y, si no está,
+    en productos.idx (y recorriendo productos.jsonl solo si ESCANEO_JSONL).
+    Los IDs cuyo lote falló (_HUECOS) se descartan sin tocar disco.
+    Devuelve ProductoOut o None si no existe.
+    """
+    p = PRODUCTS.get(producto_id)
+    if p is not None or producto_id in _HUECOS:
+        return p
+    p = _buscar_en_idx(producto_id)
+    if p is None and ESCANEO_JSONL:
+        p = _buscar_en_jsonl(producto_id)
+    return p
+
 # ==========================
 # Endpoints públicos de la API
 # ==========================
+# Respuesta de GET / serializada una sola vez al cargar el módulo (su contenido no cambia)
+ROOT_BYTES = orjson.dumps({
+    "mensaje": "API de Registro de Productos",
+    "endpoints": {
+        "crear": "POST /productos",
+        "listar": "GET /productos",
+        "detalle": "GET /productos/{id}",
+        "exportar": "GET /productos/raw"
+    },
+    "archivos": {
+        "texto": TEXT_FILE,
+        "jsonl": JSONL_FILE
+    }
+})
+
 @app.get("/", tags=["info"])
 def raiz():
     """
     Endpoint informativo.
     Útil para verificar rutas de archivos y endpoints disponibles.
+    Devuelve los bytes precalculados en ROOT_BYTES (sin serializar por petición).
     """
-    return {
-        "mensaje": "API de Registro de Productos",
-        "endpoints": {
-            "crear": "POST /productos",
-            "listar": "GET /productos",
-            "detalle": "GET /productos/{id}"
-        },
-        "archivos": {
-            "texto": TEXT_FILE,
-            "jsonl": JSONL_FILE
-        }
-    }
+    return Response(content=ROOT_BYTES, media_type="application/json")
 
 @app.post("/productos", response_model=ProductoOut, tags=["productos"], status_code=201)
-async def crear_producto(data: ProductoIn):
+async def crear_producto(data: ProductoIn, sync: bool = False):
     """
     Crea un nuevo producto.
-    - Incrementa el ID de forma segura con un lock (evita carreras).
+    - Toma el siguiente ID del contador (sin lock).
     - Asigna la fecha/hora de creación.
-    - Persiste en TXT y JSONL.
+    - Lo publica en el índice en memoria y encola su persistencia (TXT y JSONL)
+      para el escritor en segundo plano: responde sin esperar al disco.
+    - Con ?sync=1 espera a que el producto quede escrito antes de responder. Sin él,
+      el 201 no garantiza la escritura: si el lote falla, el producto se retira del índice.
+    - Si el escritor no está corriendo (la app se levantó sin lifespan, o se detuvo
+      por un error, que queda en el log) responde 503;
+      si la cola está llena, espera lugar antes de aceptar el alta (contrapresión).
     """
     global ultimo_id
-    async with lock:  # Garantiza exclusión mutua durante incremento y escritura
-        ultimo_id += 1
-        producto = ProductoOut(
-            id=ultimo_id,
-            creado_en=datetime.utcnow(),  # Fecha/hora actual (naive). Si prefieres tz: usar datetime.now(timezone.utc)
-            **data.model_dump()
-        )
-        _guardar_producto(producto)
-        return producto
+    if _writer is None or _writer.done():
+        raise HTTPException(status_code=503, detail="Escritor de productos no disponible")
+    # Se reserva lugar en la cola ANTES de tomar el ID: así el put() de abajo nunca
+    # espera y ningún alta posterior puede adelantarse en la cola.
+    await _cupos.acquire()
+    producto_id = ultimo_id = next(_id_counter)
+    # `data` ya fue validado al entrar: se arma ProductoOut con model_construct (sin
+    # revalidar) y el mismo dict se serializa UNA vez; esos bytes son a la vez la
+    # línea del JSONL y el cuerpo de la respuesta.
+    fields = data.model_dump()
+    fields["id"] = producto_id
+    fields["creado_en"] = datetime.utcnow()  # Fecha/hora actual (naive). Si prefieres tz: usar datetime.now(timezone.utc)
+    producto = ProductoOut.model_construct(**fields)
+    payload = orjson.dumps(fields)
+    PRODUCTS[producto.id] = producto
+    PRODUCTS_ORDER.append(producto.id)
+    hecho = asyncio.get_running_loop().create_future() if sync else None
+    # Entre next() y el encolado nada cede el event loop (el lugar ya está reservado):
+    # el orden de la cola (y por tanto del JSONL) sigue siendo el orden de los IDs.
+    await write_queue.put((fields, payload, hecho))
+    if hecho is not None:
+        await hecho  # Si la escritura falló, el error se propaga (500)
+    return Response(content=payload, media_type="application/json", status_code=201)
 
 @app.get("/productos", response_model=List[ProductoOut], tags=["productos"])
 def listar_productos():
     """
     Devuelve la lista completa de productos almacenados.
+    Se envía en streaming (por trozos) para no materializar toda la respuesta.
     """
-    return _leer_todos()
+    return StreamingResponse(_listar_json(), media_type="application/json")
+
+# Debe declararse antes de /productos/{producto_id}: si no, "raw" se intentaría leer como ID
+@app.get("/productos/raw", tags=["productos"])
+def exportar_productos():
+    """
+    Exportación masiva: envía productos.jsonl tal cual (NDJSON, un producto por línea).
+    Es el endpoint preferido para clientes que procesan NDJSON en streaming: no se
+    parsea ni se re-serializa nada; los bytes se copian del archivo con os.pread
+    por trozos de EXPORT_CHUNK (en el threadpool, no es un envío zero-copy).
+    Incluye las líneas de los lotes ya confirmados por el escritor en segundo plano
+    al llegar la petición (usar ?sync=1 al crear si se necesita verlo aquí de
+    inmediato); lo que se agregue durante el envío queda para la próxima exportación.
+    """
+    limite = _fin_ultima_linea(_jsonl_confirmado)
+    return StreamingResponse(
+        _exportar_jsonl(limite),
+        media_type="application/x-ndjson",
+        headers={"Content-Length": str(limite)},
+    )
 
 @app.get("/productos/{producto_id}", response_model=ProductoOut, tags=["productos"])
-def obtener_producto(producto_id: int):
+def obtener_producto(producto_id: conint(gt=0)):
     """
-    Devuelve un producto específico por ID.
+    Devuelve un producto específico por ID (entero > 0; si no, responde 422).
     Si no existe, responde 404.
+    Se serializa con orjson, igual que el resto de los endpoints.
     """
+    # Un ID mayor que el último repartido no puede existir: 404 sin tocar índice ni disco
+    if producto_id > ultimo_id:
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
     p = _leer_por_id(producto_id)
     if not p:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
-    return p
+    return Response(content=orjson.dumps(p.model_dump()), media_type="application/json")
+
+# ==========================
+# Arranque directo (python main.py)
+# ==========================
+# Equivale a `uvicorn main:app --loop uvloop --http httptools`. uvloop (event loop
+# sobre libuv) abarata cada await y cada petición; si no está instalado
+# (pip install uvloop) se usa el loop estándar de asyncio.
+if __name__ == "__main__":
+    import uvicorn
+    try:
+        import uvloop  # noqa: F401
+        loop = "uvloop"
+    except ImportError:
+        loop = "asyncio"
+    uvicorn.run(app, host="127.0.0.1", port=8000, loop=loop, http="auto")  # http="auto": httptools si está instalado